@@ -1,21 +1,31 @@
 # app.py
+import atexit
+import os
 import streamlit as st
 from datetime import date
 import pandas as pd
 
 from utils import (
     load_data, load_users, authenticate,
-    add_employee_entry, filter_data,
-    compute_kpis, get_alerts,
+    add_employee_entry, admin_query,
     generate_pdf_full, generate_pdf_alerts,
     generate_pdf_charts, generate_pdf_by_sede,
-    generate_pdf_personal
+    generate_pdf_personal, generate_pdf_report,
+    search_comments, search_index_path, load_search_index
+)
+from notifications import AlertNotifier, FileSink
+from shards import (
+    shard_path, add_employee_entry_sharded, load_data_sharded,
+    list_sedes_sharded, admin_query_sharded, search_comments_sharded
 )
 
 st.set_page_config(page_title="Bienestar Starbucks", layout="wide")
 
 DATA_PATH = "data.json"
 USERS_PATH = "users.json"
+NOTIF_PATH = "notificaciones.jsonl"
+# Si se define, los registros se guardan en un archivo por sede dentro de este directorio
+SHARDS_DIR = os.environ.get("BIENESTAR_SHARDS_DIR")
 
 
 # ---------------------------------------------
@@ -28,6 +38,26 @@ def safe_rerun():
         pass
 
 
+# ---------------------------------------------
+# NOTIFICACIONES (un worker por proceso)
+# ---------------------------------------------
+@st.cache_resource
+def get_notifier():
+    notifier = AlertNotifier(FileSink(NOTIF_PATH)).start()
+    # al reiniciar/redeployar se envían los lotes pendientes en vez de perderlos
+    atexit.register(notifier.stop)
+    return notifier
+
+
+# ---------------------------------------------
+# ÍNDICE DE BÚSQUEDA (se recarga solo si cambia el archivo de datos)
+# ---------------------------------------------
+@st.cache_resource(max_entries=2)
+def get_search_index(path, mtime_ns, size):
+    data = load_data(path)
+    return data, load_search_index(search_index_path(path), data)
+
+
 # ---------------------------------------------
 # SESSION
 # ---------------------------------------------
@@ -92,11 +122,13 @@ def employee_view(user):
     comentario = st.text_area("Comentario (opcional)")
 
     if st.button("Registrar", key="reg_employee"):
-        add_employee_entry(
-            DATA_PATH, user, fecha_hoy,
+        add_entry = add_employee_entry_sharded if SHARDS_DIR else add_employee_entry
+        add_entry(
+            SHARDS_DIR or DATA_PATH, user, fecha_hoy,
             hora_inicio, hora_salida,
             int(descanso_min), int(estres),
-            estado, comentario
+            estado, comentario,
+            notifier=get_notifier()
         )
         st.success("Registro guardado correctamente")
         safe_rerun()
@@ -106,7 +138,7 @@ def employee_view(user):
     # ----------------------------------------
     st.subheader("Mis registros")
 
-    data = load_data(DATA_PATH)
+    data = load_data(shard_path(SHARDS_DIR, user.get("sede", "")) if SHARDS_DIR else DATA_PATH)
     nombre_u = user.get("nombre", user.get("username"))
     mis_registros = [r for r in data if r.get("nombre") == nombre_u]
 
@@ -138,8 +170,14 @@ def employee_view(user):
 def admin_view(user):
     st.header("Panel Administrador — Bienestar y Cumplimiento")
 
-    data = load_data(DATA_PATH)
-    if not data:
+    # En modo shards no se carga todo el historial: las consultas van a cada shard
+    if SHARDS_DIR:
+        data = None
+        sedes_uni = list_sedes_sharded(SHARDS_DIR)
+    else:
+        data = load_data(DATA_PATH)
+        sedes_uni = sorted({d.get("sede","") for d in data})
+    if not sedes_uni:
         st.warning("No hay registros todavía.")
         if st.button("Cerrar sesión", key="logout_admin_empty"):
             logout()
@@ -152,18 +190,25 @@ def admin_view(user):
 
     ver_todo = st.sidebar.checkbox("Ver todo el historial", value=False)
 
-    sedes = ["Todas"] + sorted({d.get("sede","") for d in data})
+    sedes = ["Todas"] + sedes_uni
     sede_sel = st.sidebar.selectbox("Sede", sedes)
 
     fecha_sel = st.sidebar.date_input("Filtrar por fecha (opcional)", value=None)
 
     # Aplicación de filtros
     if ver_todo:
-        filtered = data
+        fecha_filter, sede_filter = None, None
     else:
         fecha_filter = None if fecha_sel is None else fecha_sel.strftime("%Y-%m-%d")
         sede_filter = None if sede_sel == "Todas" else sede_sel
-        filtered = filter_data(data, fecha=fecha_filter, sede=sede_filter)
+
+    # registros, alertas, KPIs, ranking y horas semanales en una sola pasada
+    # (en modo shards, una sola lectura de cada shard)
+    if SHARDS_DIR:
+        resumen = admin_query_sharded(SHARDS_DIR, fecha=fecha_filter, sede=sede_filter)
+    else:
+        resumen = admin_query(data, fecha=fecha_filter, sede=sede_filter)
+    filtered = resumen["registros"]
 
     # -----------------------------------------
     # TABS
@@ -174,15 +219,27 @@ def admin_view(user):
 
     # --- TAB REGISTROS ---
     with tab_reg:
-        st.subheader("Registros filtrados")
-        if not filtered:
+        busqueda = st.text_input("🔎 Buscar en comentarios", key="busqueda_comentarios")
+        if busqueda.strip():
+            if SHARDS_DIR:
+                registros = search_comments_sharded(SHARDS_DIR, busqueda, fecha=fecha_filter, sede=sede_filter)
+            else:
+                st_data = os.stat(DATA_PATH)
+                datos_idx, index = get_search_index(DATA_PATH, st_data.st_mtime_ns, st_data.st_size)
+                registros = search_comments(datos_idx, busqueda, index=index, fecha=fecha_filter, sede=sede_filter)
+            st.subheader(f"Registros con comentarios que contienen: {busqueda}")
+        else:
+            registros = filtered
+            st.subheader("Registros filtrados")
+
+        if not registros:
             st.info("Sin resultados")
         else:
-            df = pd.DataFrame(filtered)
+            df = pd.DataFrame(registros)
             st.dataframe(df, use_container_width=True, height=350)
 
             if st.button("📄 Descargar PDF — Registros filtrados", key="pdf_filtrado_btn"):
-                pdf = generate_pdf_full(filtered)
+                pdf = generate_pdf_full(registros)
                 with open(pdf, "rb") as f:
                     st.download_button(
                         "Descargar PDF",
@@ -193,7 +250,7 @@ def admin_view(user):
 
     # --- TAB ALERTAS ---
     with tab_alert:
-        alerts = get_alerts(filtered)
+        alerts = resumen["alertas"]
         st.subheader("Alertas detectadas")
 
         if not alerts:
@@ -212,17 +269,34 @@ def admin_view(user):
                         mime="application/pdf"
                     )
 
+        st.subheader("Riesgo de burnout por empleado")
+        ranking = resumen["ranking"]
+        if ranking.empty:
+            st.info("Sin datos suficientes")
+        else:
+            st.dataframe(ranking, use_container_width=True, height=320)
+
     # --- TAB GRÁFICAS ---
     with tab_graph:
         st.subheader("KPIs y Gráficas")
 
-        kpis = compute_kpis(filtered)
+        kpis = resumen["kpis"]
 
         c1, c2, c3 = st.columns(3)
         c1.metric("Estrés promedio", f"{kpis['estres_promedio']:.1f}")
         c2.metric("% descanso ≥ 45 min", f"{kpis['pct_descanso']:.1f}%")
         c3.metric("Alertas detectadas", kpis['alertas_count'])
 
+        h1, h2, h3 = st.columns(3)
+        h1.metric("Horas trabajadas promedio", f"{kpis['horas_promedio']:.1f} h")
+        h2.metric("% jornadas con horas extra", f"{kpis['pct_horas_extra']:.1f}%")
+        h3.metric("Empleados > 48 h semanales", kpis['empleados_extra_semanal'])
+
+        semanas = resumen["semanas"]
+        if not semanas.empty:
+            st.write("**Horas semanales por empleado**")
+            st.dataframe(semanas, use_container_width=True, height=250)
+
         if kpis["fig_week"]:
             st.pyplot(kpis["fig_week"])
         if kpis["pie_estado"]:
@@ -240,14 +314,26 @@ def admin_view(user):
 
     # --- TAB REPORTES POR SEDE ---
     with tab_report:
+        st.subheader("Reporte completo")
+
+        if st.button("📄 Generar PDF — Reporte completo (todas las sedes)", key="pdf_report_btn"):
+            pdf = generate_pdf_report(load_data_sharded(SHARDS_DIR) if SHARDS_DIR else data)
+            with open(pdf, "rb") as f:
+                st.download_button(
+                    "Descargar PDF",
+                    f.read(),
+                    file_name="reporte_completo.pdf",
+                    mime="application/pdf"
+                )
+
         st.subheader("Reportes por sede")
 
-        sedes_uni = sorted({d.get("sede","") for d in data})
         for s in sedes_uni:
             st.write(f"**{s}**")
 
             if st.button(f"📄 Generar PDF — {s}", key=f"pdf_sede_{s}"):
-                pdf = generate_pdf_by_sede(data, s)
+                datos_sede = load_data(shard_path(SHARDS_DIR, s)) if SHARDS_DIR else data
+                pdf = generate_pdf_by_sede(datos_sede, s)
                 with open(pdf, "rb") as f:
                     st.download_button(
                         f"Descargar PDF {s}",
@@ -0,0 +1,54 @@
+# bench_reports.py
+# Compara el tiempo del reporte consolidado contra los cuatro PDFs por separado.
+# Uso: python bench_reports.py [data.json] [repeticiones]
+import os
+import sys
+import time
+
+from utils import (
+    load_data, generate_pdf_full, generate_pdf_alerts, generate_pdf_charts,
+    generate_pdf_by_sede, generate_pdf_report, get_alerts
+)
+
+
+def cuatro_pdfs(data):
+    """Enfoque anterior: un PDF por sección, cada uno recalcula todo"""
+    paths = [
+        generate_pdf_full(data),
+        generate_pdf_alerts(get_alerts(data)),
+        generate_pdf_charts(data),
+    ]
+    for sede in sorted({d.get("sede") or "" for d in data}):
+        paths.append(generate_pdf_by_sede(data, sede))
+    return paths
+
+
+def consolidado(data):
+    return [generate_pdf_report(data)]
+
+
+def medir(fn, data, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        paths = fn(data)
+        tiempos.append(time.perf_counter() - t0)
+        for p in paths:
+            if p and os.path.exists(p):
+                os.remove(p)
+    return min(tiempos), sum(tiempos) / len(tiempos)
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else "data.json"
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    data = load_data(path)
+    print(f"{len(data)} registros, {repeticiones} repeticiones")
+
+    for nombre, fn in (("4 PDFs por separado", cuatro_pdfs), ("Reporte consolidado", consolidado)):
+        mejor, promedio = medir(fn, data, repeticiones)
+        print(f"{nombre:<22} mejor {mejor:.3f} s   promedio {promedio:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
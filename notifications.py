@@ -0,0 +1,186 @@
+# notifications.py
+import asyncio
+import json
+import logging
+import threading
+import urllib.request
+from collections import defaultdict
+from datetime import datetime
+
+from utils import evaluate_entry
+
+logger = logging.getLogger(__name__)
+
+
+async def _run_blocking(fn, *args):
+    """
+    Ejecuta fn en el executor por defecto del loop. Durante atexit los executors ya no
+    aceptan tareas; en ese caso (solo el envío final) se ejecuta directamente.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        fut = loop.run_in_executor(None, fn, *args)
+    except RuntimeError:
+        return fn(*args)
+    return await fut
+
+
+# -----------------------------
+# Sinks (destino de las notificaciones)
+# -----------------------------
+class FileSink:
+    """Escribe cada lote como una línea JSON en un archivo local"""
+
+    def __init__(self, path="notificaciones.jsonl"):
+        self.path = path
+
+    async def send(self, sede, alerts):
+        line = json.dumps({
+            "enviado": datetime.now().isoformat(timespec="seconds"),
+            "sede": sede,
+            "alertas": alerts
+        }, ensure_ascii=False)
+        await _run_blocking(self._append, line)
+
+    def _append(self, line):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class WebhookSink:
+    """Envía cada lote por POST (JSON) a una URL"""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    async def send(self, sede, alerts):
+        body = json.dumps({"sede": sede, "alertas": alerts}, ensure_ascii=False).encode("utf-8")
+        await _run_blocking(self._post, body)
+
+    def _post(self, body):
+        req = urllib.request.Request(
+            self.url, data=body, headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            resp.read()
+
+
+# -----------------------------
+# Pipeline de alertas
+# -----------------------------
+class AlertNotifier:
+    """
+    Worker asyncio (en un hilo propio) que recibe registros nuevos, evalúa sus
+    alertas una por una y las agrupa por sede: cada sede se envía al sink
+    `debounce` segundos después de su primera alerta pendiente, o antes si
+    acumula `max_batch` alertas. Si el sink falla, el lote se conserva y se
+    reintenta tras otro `debounce` (hasta `max_pending` alertas por sede).
+    """
+
+    def __init__(self, sink, debounce=10.0, max_batch=50, max_pending=1000):
+        self.sink = sink
+        self.debounce = debounce
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self._loop = None
+        self._queue = None
+        self._thread = None
+        self._task = None
+        self._pending = defaultdict(list)
+        self._timers = {}
+        self._failing = set()
+        self._ready = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._thread = threading.Thread(target=self._run, name="alert-notifier", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def publish(self, entry, riesgo=None):
+        """Encola un registro nuevo; se puede llamar desde cualquier hilo"""
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (entry, riesgo))
+
+    def stop(self, timeout=10):
+        """Procesa lo encolado, envía los lotes pendientes y detiene el worker"""
+        if self._loop is None:
+            return
+        fut = asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+        fut.result(timeout)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._loop = None
+        self._thread = None
+        self._ready.clear()     # un start() posterior espera al loop nuevo
+
+    # --- interno (corre en el loop del worker) ---
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._task = self._loop.create_task(self._worker())
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    async def _worker(self):
+        while True:
+            entry, riesgo = await self._queue.get()
+            try:
+                alert = evaluate_entry(entry, riesgo)
+                if alert:
+                    await self._add(alert)
+            except Exception:
+                # un registro malformado no debe detener el worker
+                logger.exception("No se pudo evaluar el registro %r", entry)
+            finally:
+                self._queue.task_done()
+
+    async def _add(self, alert):
+        sede = alert.get("sede", "")
+        self._pending[sede].append(alert)
+        if len(self._pending[sede]) >= self.max_batch and sede not in self._failing:
+            await self._flush(sede)
+        else:
+            self._schedule(sede)
+
+    def _schedule(self, sede):
+        if sede not in self._timers:
+            self._timers[sede] = self._loop.call_later(
+                self.debounce, lambda: self._loop.create_task(self._flush(sede))
+            )
+
+    async def _flush(self, sede, retry=True):
+        timer = self._timers.pop(sede, None)
+        if timer is not None:
+            timer.cancel()
+        alerts = self._pending.pop(sede, [])
+        if not alerts:
+            return
+        try:
+            await self.sink.send(sede, alerts)
+            self._failing.discard(sede)
+        except Exception:
+            if not retry:
+                logger.exception("No se pudo enviar el lote de %s; se descartan %d alertas", sede, len(alerts))
+                return
+            # se conserva el lote (delante de las alertas nuevas) y se reintenta más tarde
+            logger.exception("No se pudo enviar el lote de %s; se reintentará", sede)
+            self._failing.add(sede)
+            alerts = alerts + self._pending.pop(sede, [])
+            if len(alerts) > self.max_pending:
+                logger.warning("Sede %s: se descartan %d alertas antiguas", sede, len(alerts) - self.max_pending)
+                alerts = alerts[-self.max_pending:]
+            self._pending[sede] = alerts
+            self._schedule(sede)
+
+    async def _shutdown(self):
+        await self._queue.join()
+        for sede in list(self._pending):
+            await self._flush(sede, retry=False)
+        self._task.cancel()
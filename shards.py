@@ -0,0 +1,230 @@
+# shards.py
+import os
+import re
+import time
+import unicodedata
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from utils import (
+    load_data, save_data, add_employee_entry, filter_data,
+    get_alerts, filtered_kpi_partials, merge_kpi_partials, kpis_from_partials,
+    admin_partials, weekly_hours,
+    search_comments, search_index_path, load_search_index
+)
+
+CATALOGO_SEDES = "_sedes.json"
+
+# índice de búsqueda en memoria por shard: path -> ((mtime_ns, tamaño), data, índice)
+_SEARCH_CACHE = {}
+
+# -----------------------------
+# Ruteo: sede (o región) -> archivo de shard
+# -----------------------------
+def shard_key(sede, regiones=None):
+    """Clave del shard: la región de la sede si se pasa el mapeo `regiones`, si no la sede"""
+    if regiones:
+        return regiones.get(sede, sede)
+    return sede
+
+def shard_path(base_dir, sede, regiones=None):
+    """Archivo JSON del shard de una sede (p. ej. shards/san_isidro.json)"""
+    key = unicodedata.normalize("NFKD", shard_key(sede, regiones) or "sin_sede")
+    key = key.encode("ascii", "ignore").decode("ascii").lower()
+    key = re.sub(r"[^a-z0-9]+", "_", key).strip("_") or "sin_sede"
+    return os.path.join(base_dir, f"{key}.json")
+
+def list_shards(base_dir):
+    """
+    Archivos de datos de shard en base_dir: solo nombres que shard_path puede generar
+    ([a-z0-9_].json, sin "_" inicial). Así se ignoran los archivos asociados
+    (*.riesgo.json, *.busqueda.json), que llevan un punto que ninguna sede produce,
+    y los internos que empiezan con "_".
+    """
+    try:
+        names = sorted(os.listdir(base_dir))
+    except FileNotFoundError:
+        return []
+    return [
+        os.path.join(base_dir, n) for n in names
+        if re.fullmatch(r"[a-z0-9][a-z0-9_]*\.json", n)
+    ]
+
+@contextmanager
+def _shard_lock(path, timeout=10.0):
+    """
+    Lock exclusivo (flock / msvcrt) sobre path + ".lock" para escrituras desde varios
+    procesos. El sistema operativo lo libera si el proceso muere, así que un lock
+    huérfano no bloquea el shard.
+    """
+    with open(path + ".lock", "a+") as f:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"No se pudo bloquear {path}")
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+# -----------------------------
+# Catálogo de sedes (evita leer los shards solo para listar sedes)
+# -----------------------------
+def _register_sedes(base_dir, sedes):
+    path = os.path.join(base_dir, CATALOGO_SEDES)
+    with _shard_lock(path):
+        actuales = load_data(path)
+        nuevas = sorted(set(actuales) | set(sedes))
+        if nuevas != actuales:
+            save_data(path, nuevas)
+
+def list_sedes_sharded(base_dir):
+    """Sedes con registros; si no hay catálogo se reconstruye leyendo los shards una vez"""
+    path = os.path.join(base_dir, CATALOGO_SEDES)
+    if os.path.exists(path):
+        return load_data(path)
+    sedes = sorted({d.get("sede") or "" for d in load_data_sharded(base_dir)})
+    if sedes:
+        _register_sedes(base_dir, sedes)
+    return sedes
+
+# -----------------------------
+# Escrituras
+# -----------------------------
+def add_employee_entry_sharded(base_dir, user, fecha, hora_inicio, hora_salida, descanso, estres,
+                               estado, comentario, notifier=None, regiones=None):
+    """Igual que add_employee_entry, pero escribe en el shard de user["sede"]"""
+    os.makedirs(base_dir, exist_ok=True)
+    path = shard_path(base_dir, user.get("sede", ""), regiones)
+    with _shard_lock(path):
+        entry = add_employee_entry(path, user, fecha, hora_inicio, hora_salida, descanso,
+                                   estres, estado, comentario, notifier=notifier)
+    _register_sedes(base_dir, [entry["sede"]])
+    return entry
+
+def split_into_shards(data, base_dir, regiones=None):
+    """Reparte un historial existente (p. ej. data.json) en archivos de shard"""
+    os.makedirs(base_dir, exist_ok=True)
+    grupos = {}
+    for d in data:
+        grupos.setdefault(shard_path(base_dir, d.get("sede", ""), regiones), []).append(d)
+    for path, registros in grupos.items():
+        with _shard_lock(path):
+            save_data(path, registros)
+    _register_sedes(base_dir, {d.get("sede") or "" for d in data})
+    return sorted(grupos)
+
+# -----------------------------
+# Consultas scatter-gather
+# -----------------------------
+def _target_shards(base_dir, sede=None, regiones=None):
+    if sede:
+        path = shard_path(base_dir, sede, regiones)
+        return [path] if os.path.exists(path) else []
+    return list_shards(base_dir)
+
+def _scatter(base_dir, fn, sede=None, regiones=None, max_workers=8):
+    """Aplica fn(path) a cada shard en paralelo y devuelve los resultados en orden de shard"""
+    paths = _target_shards(base_dir, sede, regiones)
+    if len(paths) <= 1:
+        return [fn(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+        return list(pool.map(fn, paths))
+
+def load_data_sharded(base_dir, regiones=None):
+    return [d for part in _scatter(base_dir, load_data, regiones=regiones) for d in part]
+
+def filter_data_sharded(base_dir, fecha=None, sede=None, regiones=None):
+    parts = _scatter(
+        base_dir, lambda p: filter_data(load_data(p), fecha=fecha, sede=sede),
+        sede=sede, regiones=regiones
+    )
+    return [d for part in parts for d in part]
+
+def get_alerts_sharded(base_dir, fecha=None, sede=None, regiones=None):
+    """
+    Alertas de todos los shards. Las reglas por empleado (rachas, horas semanales)
+    agrupan por sede + nombre, así que cada shard se evalúa por separado sin perder nada.
+    """
+    parts = _scatter(
+        base_dir, lambda p: get_alerts(load_data(p), fecha=fecha, sede=sede),
+        sede=sede, regiones=regiones
+    )
+    return [a for part in parts for a in part]
+
+def compute_kpis_sharded(base_dir, fecha=None, sede=None, regiones=None):
+    """KPIs globales: cada shard calcula sus agregados parciales y aquí se combinan"""
+    parts = _scatter(
+        base_dir, lambda p: filtered_kpi_partials(load_data(p), fecha=fecha, sede=sede),
+        sede=sede, regiones=regiones
+    )
+    return kpis_from_partials(merge_kpi_partials(parts))
+
+def _shard_search_index(path):
+    """(data, índice) de un shard, en caché por shard; se recarga si cambian su mtime o tamaño"""
+    st = os.stat(path)
+    firma = (st.st_mtime_ns, st.st_size)
+    cached = _SEARCH_CACHE.get(path)
+    if cached is not None and cached[0] == firma:
+        return cached[1], cached[2]
+    data = load_data(path)
+    index = load_search_index(search_index_path(path), data)
+    _SEARCH_CACHE[path] = (firma, data, index)
+    return data, index
+
+def search_comments_sharded(base_dir, query, fecha=None, sede=None, regiones=None):
+    """Búsqueda en comentarios sobre el índice de cada shard, en paralelo"""
+    def _search(path):
+        data, index = _shard_search_index(path)
+        return search_comments(data, query, index=index, fecha=fecha, sede=sede)
+
+    parts = _scatter(base_dir, _search, sede=sede, regiones=regiones)
+    return [d for part in parts for d in part]
+
+def admin_query_sharded(base_dir, fecha=None, sede=None, regiones=None):
+    """
+    Todo lo que necesita el panel admin leyendo cada shard una sola vez (en paralelo):
+    registros filtrados, alertas, KPIs combinados, ranking de riesgo y horas semanales.
+    """
+    parts = _scatter(
+        base_dir, lambda p: admin_partials(load_data(p), fecha=fecha, sede=sede),
+        sede=sede, regiones=regiones
+    )
+    rankings = [p["ranking"] for p in parts if not p["ranking"].empty]
+    ranking = (
+        pd.concat(rankings).sort_values("riesgo", ascending=False).reset_index(drop=True)
+        if rankings else pd.DataFrame()
+    )
+    semanas = [p["semanas"] for p in parts if not p["semanas"].empty]
+    semanas = (
+        pd.concat(semanas).sort_values(["sede", "nombre", "semana"]).reset_index(drop=True)
+        if semanas else weekly_hours([])
+    )
+    return {
+        "registros": [d for p in parts for d in p["registros"]],
+        "alertas": [a for p in parts for a in p["alertas"]],
+        "kpis": kpis_from_partials(merge_kpi_partials([p["parts"] for p in parts])),
+        "ranking": ranking,
+        "semanas": semanas,
+    }
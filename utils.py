@@ -1,4 +1,5 @@
 # utils.py
+import hashlib
 import json
 from datetime import datetime, date, timedelta
 import pandas as pd
@@ -7,6 +8,8 @@ from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 import matplotlib.pyplot as plt
 import os
+import re
+import unicodedata
 
 # -----------------------------
 # Helpers JSON
@@ -38,7 +41,12 @@ def authenticate(username, password, users):
 # -----------------------------
 # Add entry
 # -----------------------------
-def add_employee_entry(path, user, fecha, hora_inicio, hora_salida, descanso, estres, estado, comentario):
+def add_employee_entry(path, user, fecha, hora_inicio, hora_salida, descanso, estres, estado, comentario, notifier=None):
+    """
+    Guarda el registro y actualiza el estado de riesgo y el índice de búsqueda.
+    Si se pasa `notifier` (notifications.AlertNotifier), le publica el registro
+    para evaluar sus alertas.
+    """
     data = load_data(path)
     entry = {
         "nombre": user.get("nombre", user.get("username", "")),
@@ -51,8 +59,346 @@ def add_employee_entry(path, user, fecha, hora_inicio, hora_salida, descanso, es
         "estado": estado,
         "comentario": comentario.strip() if comentario else ""
     }
+    state_path = burnout_state_path(path)
+    state = load_burnout_state(state_path, data)
+    index_path = search_index_path(path)
+    index = load_search_index(index_path, data)
     data.append(entry)
     save_data(path, data)
+    riesgo = update_burnout_state(state, entry)
+    save_data(state_path, state)
+    append_search_index(index_path, index, len(data) - 1, entry)
+    if notifier is not None:
+        notifier.publish(entry, riesgo)
+    return entry
+
+# -----------------------------
+# Horas trabajadas (vectorizado)
+# -----------------------------
+JORNADA_DIARIA_MIN = 8 * 60      # jornada ordinaria diaria
+JORNADA_SEMANAL_MIN = 48 * 60    # máximo semanal
+JORNADA_ALERTA_MIN = 10 * 60     # jornada diaria que dispara alerta
+
+def _hhmm_to_minutes(s):
+    """Convierte una Serie de strings "HH:MM" en minutos desde medianoche (NaN si no es válida)"""
+    t = pd.to_datetime(s, format="%H:%M", errors="coerce")
+    minutos = (t.dt.hour * 60 + t.dt.minute).astype(float)
+    # formatos menos comunes (" 09:30", "07:15:00"): regex solo sobre los que fallaron
+    resto = minutos.isna() & s.notna()
+    if resto.any():
+        parts = s[resto].astype(str).str.extract(r"^\s*(\d{1,2}):(\d{2})")
+        h = pd.to_numeric(parts[0], errors="coerce")
+        m = pd.to_numeric(parts[1], errors="coerce")
+        minutos[resto] = (h * 60 + m).where((h < 24) & (m < 60))
+    return minutos
+
+def compute_worked_hours(data):
+    """
+    Devuelve un DataFrame con los registros y las columnas calculadas:
+    minutos_turno, minutos_trabajados, minutos_extra, extra_diaria,
+    semana, minutos_semana, extra_semanal, minutos_acum_semana, cruza_semanal.
+    Los turnos nocturnos (salida <= inicio) cruzan la medianoche. cruza_semanal
+    marca solo el registro con el que el acumulado de la semana pasa de 48 h.
+    """
+    df = pd.DataFrame(data)
+    if df.empty:
+        return df
+
+    for col in ["nombre", "sede", "fecha", "hora_inicio", "hora_salida"]:
+        if col not in df.columns:
+            df[col] = ""
+    df["nombre"] = df["nombre"].fillna("")
+    df["sede"] = df["sede"].fillna("")
+
+    inicio = _hhmm_to_minutes(df["hora_inicio"])
+    salida = _hhmm_to_minutes(df["hora_salida"])
+    descanso = pd.to_numeric(df["descanso"], errors="coerce").fillna(0) if "descanso" in df.columns else 0
+
+    df["minutos_turno"] = (salida - inicio) % (24 * 60)
+    df["minutos_trabajados"] = (df["minutos_turno"] - descanso).clip(lower=0)
+    df["minutos_extra"] = (df["minutos_trabajados"] - JORNADA_DIARIA_MIN).clip(lower=0)
+    df["extra_diaria"] = df["minutos_trabajados"] > JORNADA_DIARIA_MIN
+
+    fechas = pd.to_datetime(df["fecha"], errors="coerce")
+    df["semana"] = fechas.dt.to_period("W").dt.start_time
+    df["minutos_semana"] = (
+        df.groupby(["nombre", "sede", "semana"])["minutos_trabajados"].transform("sum")
+    )
+    df["extra_semanal"] = df["minutos_semana"] > JORNADA_SEMANAL_MIN
+
+    # acumulado de la semana en orden de fecha (se reasigna por índice)
+    ordenado = df.assign(_fecha=fechas, _min=df["minutos_trabajados"].fillna(0)).sort_values("_fecha", kind="stable")
+    df["minutos_acum_semana"] = ordenado.groupby(["nombre", "sede", "semana"])["_min"].cumsum()
+    df["cruza_semanal"] = (
+        (df["minutos_acum_semana"] > JORNADA_SEMANAL_MIN)
+        & (df["minutos_acum_semana"] - df["minutos_trabajados"].fillna(0) <= JORNADA_SEMANAL_MIN)
+    )
+    return df
+
+def weekly_hours(data, fecha=None, sede=None, horas=None):
+    """
+    Totales semanales por empleado y sede: sede, nombre, semana, horas_trabajadas,
+    horas_extra_diarias, extra_semanal. Se calculan sobre todo `data`; fecha deja
+    solo la semana que la contiene y sede, las de esa sede.
+    horas: compute_worked_hours(data) ya calculado.
+    """
+    df = compute_worked_hours(data) if horas is None else horas
+    cols = ["sede", "nombre", "semana", "horas_trabajadas", "horas_extra_diarias", "extra_semanal"]
+    if df.empty:
+        return pd.DataFrame(columns=cols)
+
+    agg = (
+        df.dropna(subset=["semana"])
+        .groupby(["sede", "nombre", "semana"], as_index=False)
+        .agg(minutos=("minutos_trabajados", "sum"), extra=("minutos_extra", "sum"))
+    )
+    agg["horas_trabajadas"] = agg["minutos"] / 60
+    agg["horas_extra_diarias"] = agg["extra"] / 60
+    agg["extra_semanal"] = agg["minutos"] > JORNADA_SEMANAL_MIN
+    if fecha:
+        semana = pd.Timestamp(fecha).to_period("W").start_time
+        agg = agg[agg["semana"] == semana]
+    if sede:
+        agg = agg[agg["sede"] == sede]
+    return agg[cols].sort_values(["sede", "nombre", "semana"]).reset_index(drop=True)
+
+# -----------------------------
+# Riesgo de burnout (ventanas móviles por empleado)
+# -----------------------------
+VENTANA_DIAS = 7
+ESTADOS_RIESGO = ["Estresado", "Agotado"]
+RACHA_ALERTA = 3        # días seguidos que disparan alerta
+CARGA_ALERTA = 7.0      # estrés sostenido (suma en ventana / días) que dispara alerta
+
+def _burnout_score(carga, racha_descanso, racha_estado):
+    """Puntaje 0-100: 10 pts por punto de estrés sostenido y por cada día de racha"""
+    return min(100.0, 10 * carga + 10 * racha_descanso + 10 * racha_estado)
+
+def _burnout_level(score):
+    if score >= 70:
+        return "Alto"
+    if score >= 40:
+        return "Medio"
+    return "Bajo"
+
+def _burnout_days(data, window=VENTANA_DIAS):
+    """
+    (df, dias): los registros con fecha válida y una fila por empleado y día, ordenada
+    por sede, nombre y fecha, con las métricas de compute_burnout_scores más
+    estres_suma / registros (del día) y gap (días desde el día anterior del empleado).
+    """
+    df = pd.DataFrame(data)
+    if df.empty:
+        return df, None
+
+    for col in ["nombre", "sede", "estado"]:
+        if col not in df.columns:
+            df[col] = ""
+    df["nombre"] = df["nombre"].fillna("")
+    df["sede"] = df["sede"].fillna("")
+    df["estres"] = pd.to_numeric(df["estres"], errors="coerce").fillna(0) if "estres" in df.columns else 0
+    df["descanso"] = pd.to_numeric(df["descanso"], errors="coerce").fillna(0) if "descanso" in df.columns else 0
+    df["fecha"] = pd.to_datetime(df["fecha"], errors="coerce") if "fecha" in df.columns else pd.NaT
+    df = df.dropna(subset=["fecha"])
+    if df.empty:
+        return df, None
+
+    # una fila por empleado y día
+    keys = ["sede", "nombre"]
+    df["_corto"] = df["descanso"] < 30
+    df["_estado"] = df["estado"].isin(ESTADOS_RIESGO)
+    dias = (
+        df.groupby(keys + ["fecha"], sort=True)
+        .agg(estres=("estres", "mean"), estres_suma=("estres", "sum"), registros=("estres", "size"),
+             corto=("_corto", "any"), estado=("_estado", "any"))
+        .reset_index()
+    )
+
+    # dias ya está ordenado por las claves del groupby: el resultado sale en el mismo orden
+    roll = dias.groupby(keys, sort=True).rolling(f"{window}D", on="fecha")["estres"]
+    dias["estres_media"] = roll.mean().to_numpy()
+    dias["carga_estres"] = roll.sum().to_numpy() / window
+
+    # un bloque nuevo empieza con el primer día del empleado o tras un hueco > 1 día
+    gap = dias.groupby(keys)["fecha"].diff()
+    dias["gap"] = gap.dt.days
+    nuevo_bloque = gap.isna() | (gap > pd.Timedelta(days=1))
+    for flag, col in [(dias["corto"], "racha_descanso_corto"), (dias["estado"], "racha_estado")]:
+        corte = (~flag | nuevo_bloque).cumsum()
+        dias[col] = flag.astype(int).groupby(corte).cumsum()
+
+    dias["riesgo"] = (
+        10 * dias["carga_estres"] + 10 * dias["racha_descanso_corto"] + 10 * dias["racha_estado"]
+    ).clip(upper=100)
+    dias["nivel"] = pd.cut(dias["riesgo"], [-1, 40, 70, 101], labels=["Bajo", "Medio", "Alto"], right=False).astype(str)
+    return df, dias
+
+def compute_burnout_scores(data, window=VENTANA_DIAS):
+    """
+    Calcula por registro (vectorizado, agrupado por sede + nombre):
+    estres_media (media en los últimos `window` días), carga_estres (suma / window,
+    los días sin registro cuentan como 0), racha_descanso_corto y racha_estado
+    (días seguidos con descanso < 30 o estado Estresado/Agotado), riesgo y nivel.
+    Varios registros del mismo día cuentan como un solo día (estrés promedio del día;
+    el día cuenta para la racha si alguno de sus registros cumple la condición).
+    El índice conserva la posición de cada registro en `data`.
+    """
+    cols = ["sede", "nombre", "fecha", "estres_media", "carga_estres",
+            "racha_descanso_corto", "racha_estado", "riesgo", "nivel"]
+    df, dias = _burnout_days(data, window)
+    if dias is None:
+        return pd.DataFrame(columns=cols)
+    keys = ["sede", "nombre"]
+
+    # de vuelta a cada registro (join conserva el índice de df)
+    out = df[keys + ["fecha"]].join(dias.set_index(keys + ["fecha"])[cols[3:]], on=keys + ["fecha"])
+    out = out.sort_values(keys + ["fecha"], kind="stable")
+    out["fecha"] = out["fecha"].dt.strftime("%Y-%m-%d")
+    return out[cols]
+
+def burnout_ranking(data, window=VENTANA_DIAS, fecha=None, sede=None, scores=None):
+    """
+    Último puntaje de cada empleado, ordenado de mayor a menor riesgo. Los puntajes se
+    calculan sobre todo el historial y después se aplican los filtros fecha/sede.
+    scores: compute_burnout_scores(data, window) ya calculado.
+    """
+    if scores is None:
+        scores = compute_burnout_scores(data, window)
+    if fecha:
+        scores = scores[scores["fecha"] == fecha]
+    if sede:
+        scores = scores[scores["sede"] == sede]
+    if scores.empty:
+        return scores
+    ultimo = scores.groupby(["sede", "nombre"]).tail(1)
+    return ultimo.sort_values("riesgo", ascending=False).reset_index(drop=True)
+
+def update_burnout_state(state, entry, window=VENTANA_DIAS):
+    """
+    Actualiza en O(1) el estado incremental del empleado de `entry`
+    (mismas métricas que compute_burnout_scores) y devuelve su registro de estado.
+    Un segundo registro del mismo día actualiza ese día en vez de sumar otro.
+    state: dict {"sede|nombre": {...}} que se persiste en JSON.
+    """
+    sede = entry.get("sede") or ""
+    nombre = entry.get("nombre") or ""
+    key = f"{sede}|{nombre}"
+    try:
+        fecha = datetime.strptime(str(entry.get("fecha", "")), "%Y-%m-%d").date()
+    except ValueError:
+        return state.get(key)
+    try:
+        estres_val = int(entry.get("estres", 0))
+    except Exception:
+        estres_val = 0
+    try:
+        descanso_val = int(entry.get("descanso", 0))
+    except Exception:
+        descanso_val = 0
+    corto = descanso_val < 30
+    en_riesgo = entry.get("estado", "") in ESTADOS_RIESGO
+
+    prev = state.get(key)
+    ventana = []
+    previa_desc = previa_est = 0    # rachas hasta el día anterior
+    if prev:
+        ultima = datetime.strptime(prev["fecha"], "%Y-%m-%d").date()
+        inicio = fecha - timedelta(days=window)
+        ventana = [v for v in prev["ventana"] if datetime.strptime(v[0], "%Y-%m-%d").date() > inicio]
+        dias = (fecha - ultima).days
+        if dias == 0:
+            previa_desc, previa_est = prev["racha_previa"]
+            corto = corto or prev["dia_corto"]
+            en_riesgo = en_riesgo or prev["dia_estado"]
+        elif dias == 1:
+            previa_desc, previa_est = prev["racha_descanso_corto"], prev["racha_estado"]
+
+    # ventana: [fecha, suma de estrés del día, registros del día]
+    if ventana and ventana[-1][0] == fecha.isoformat():
+        ventana[-1] = [ventana[-1][0], ventana[-1][1] + estres_val, ventana[-1][2] + 1]
+    else:
+        ventana.append([fecha.isoformat(), estres_val, 1])
+
+    racha_desc = previa_desc + 1 if corto else 0
+    racha_est = previa_est + 1 if en_riesgo else 0
+    suma = sum(v[1] / v[2] for v in ventana)
+    score = _burnout_score(suma / window, racha_desc, racha_est)
+
+    state[key] = {
+        "sede": sede,
+        "nombre": nombre,
+        "fecha": fecha.isoformat(),
+        "ventana": ventana,
+        "dia_corto": corto,
+        "dia_estado": en_riesgo,
+        "racha_previa": [previa_desc, previa_est],
+        "estres_media": suma / len(ventana),
+        "carga_estres": suma / window,
+        "racha_descanso_corto": racha_desc,
+        "racha_estado": racha_est,
+        "riesgo": score,
+        "nivel": _burnout_level(score),
+    }
+    return state[key]
+
+def build_burnout_state(data, window=VENTANA_DIAS):
+    """
+    Reconstruye el estado incremental (mismo formato que update_burnout_state) a partir
+    de las métricas diarias vectorizadas: último día de cada empleado y los días de su
+    ventana.
+    """
+    _, dias = _burnout_days(data, window)
+    if dias is None:
+        return {}
+    keys = ["sede", "nombre"]
+
+    # rachas hasta el día anterior (0 si el último día no sigue a otro)
+    g = dias.groupby(keys)
+    consecutivo = dias["gap"] == 1
+    dias["previa_desc"] = g["racha_descanso_corto"].shift(1).where(consecutivo, 0).fillna(0)
+    dias["previa_est"] = g["racha_estado"].shift(1).where(consecutivo, 0).fillna(0)
+
+    ultima = g["fecha"].transform("max")
+    en_ventana = dias[dias["fecha"] > ultima - pd.Timedelta(days=window)]
+    ventanas = {}
+    for sede, nombre, fecha, suma, n in en_ventana[keys + ["fecha", "estres_suma", "registros"]].itertuples(index=False):
+        ventanas.setdefault((sede, nombre), []).append([fecha.strftime("%Y-%m-%d"), float(suma), int(n)])
+
+    state = {}
+    for r in g.tail(1).itertuples(index=False):
+        ventana = ventanas[(r.sede, r.nombre)]
+        suma = r.carga_estres * window
+        state[f"{r.sede}|{r.nombre}"] = {
+            "sede": r.sede,
+            "nombre": r.nombre,
+            "fecha": r.fecha.strftime("%Y-%m-%d"),
+            "ventana": ventana,
+            "dia_corto": bool(r.corto),
+            "dia_estado": bool(r.estado),
+            "racha_previa": [int(r.previa_desc), int(r.previa_est)],
+            "estres_media": suma / len(ventana),
+            "carga_estres": float(r.carga_estres),
+            "racha_descanso_corto": int(r.racha_descanso_corto),
+            "racha_estado": int(r.racha_estado),
+            "riesgo": float(r.riesgo),
+            "nivel": r.nivel,
+        }
+    return state
+
+def burnout_state_path(path):
+    """Archivo de estado de riesgo asociado a un archivo de datos (data.json -> data.riesgo.json)"""
+    return os.path.splitext(path)[0] + ".riesgo.json"
+
+def load_burnout_state(path, data=None):
+    """Carga el estado de riesgo; si no existe (o tiene un formato anterior) lo reconstruye desde `data`"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if all("racha_previa" in v for v in state.values()):
+            return state
+    except Exception:
+        pass
+    return build_burnout_state(data or [])
 
 # -----------------------------
 # Filters & alerts
@@ -65,52 +411,260 @@ def filter_data(data, fecha=None, sede=None):
         filtered = [d for d in filtered if d.get("sede") == sede]
     return filtered
 
-def get_alerts(data):
+def _filter_mask(data, fecha=None, sede=None):
+    """Misma condición que filter_data, como lista de booleanos alineada con data"""
+    return [
+        (not fecha or d.get("fecha") == fecha) and (not sede or d.get("sede") == sede)
+        for d in data
+    ]
+
+def _alert_for_record(d, minutos_trabajados=0, extra_semanal=False, carga=0, racha_desc=0, racha_est=0):
+    """Aplica las reglas de alerta a un registro; devuelve el dict de alerta o None"""
+    motivos = []
+    try:
+        estres_val = int(d.get("estres", 0))
+    except Exception:
+        estres_val = 0
+    try:
+        descanso_val = int(d.get("descanso", 0))
+    except Exception:
+        descanso_val = 0
+
+    if estres_val >= 8:
+        motivos.append("Estrés alto ≥ 8")
+    if descanso_val < 30:
+        motivos.append("Descanso insuficiente < 30 min")
+    if d.get("estado", "") in ["Estresado", "Agotado"]:
+        motivos.append(f"Estado emocional: {d.get('estado')}")
+    if minutos_trabajados > JORNADA_ALERTA_MIN:
+        motivos.append("Jornada > 10 h")
+    if extra_semanal:
+        motivos.append("Horas semanales > 48 h")
+    if carga >= CARGA_ALERTA:
+        motivos.append(f"Estrés sostenido ≥ {CARGA_ALERTA:g} ({VENTANA_DIAS} días)")
+    if racha_desc >= RACHA_ALERTA:
+        motivos.append(f"Descanso corto {int(racha_desc)} días seguidos")
+    if racha_est >= RACHA_ALERTA:
+        motivos.append(f"Estresado/Agotado {int(racha_est)} días seguidos")
+
+    if not motivos:
+        return None
+    return {
+        "sede": d.get("sede", ""),
+        "nombre": d.get("nombre", ""),
+        "motivo": ", ".join(motivos),
+        "estres": estres_val,
+        "fecha": d.get("fecha", "")
+    }
+
+def get_alerts(data, fecha=None, sede=None, horas=None, scores=None):
+    """
+    Alertas de los registros que cumplen los filtros fecha/sede. Las reglas que
+    dependen del historial (horas semanales, rachas, estrés sostenido) se calculan
+    sobre todo `data` y luego se filtra. horas / scores: compute_worked_hours(data) /
+    compute_burnout_scores(data) ya calculados.
+    """
     alerts = []
-    for d in data:
-        motivos = []
-        try:
-            estres_val = int(d.get("estres", 0))
-        except Exception:
-            estres_val = 0
-        try:
-            descanso_val = int(d.get("descanso", 0))
-        except Exception:
-            descanso_val = 0
-
-        if estres_val >= 8:
-            motivos.append("Estrés alto ≥ 8")
-        if descanso_val < 30:
-            motivos.append("Descanso insuficiente < 30 min")
-        if d.get("estado", "") in ["Estresado", "Agotado"]:
-            motivos.append(f"Estado emocional: {d.get('estado')}")
-
-        if motivos:
-            alerts.append({
-                "sede": d.get("sede", ""),
-                "nombre": d.get("nombre", ""),
-                "motivo": ", ".join(motivos),
-                "estres": estres_val,
-                "fecha": d.get("fecha", "")
-            })
+    if horas is None:
+        horas = compute_worked_hours(data)
+    if horas.empty:
+        return alerts
+    trabajados = horas["minutos_trabajados"].fillna(0).tolist()
+    cruza_semanal = horas["cruza_semanal"].tolist()
+    if scores is None:
+        scores = compute_burnout_scores(data)
+    riesgo = scores.reindex(range(len(data)))
+    carga = riesgo["carga_estres"].fillna(0).tolist()
+    racha_desc = riesgo["racha_descanso_corto"].fillna(0).tolist()
+    racha_est = riesgo["racha_estado"].fillna(0).tolist()
+    mask = _filter_mask(data, fecha, sede)
+    for i, d in enumerate(data):
+        if not mask[i]:
+            continue
+        alert = _alert_for_record(d, trabajados[i], cruza_semanal[i], carga[i], racha_desc[i], racha_est[i])
+        if alert:
+            alerts.append(alert)
     return alerts
 
+def evaluate_entry(entry, riesgo=None):
+    """
+    Evalúa las reglas de alerta sobre un único registro nuevo, sin reescanear el historial.
+    riesgo: registro de estado incremental del empleado (update_burnout_state); si no se
+    pasa, las reglas de rachas y estrés sostenido no se evalúan. La regla semanal de
+    horas extra necesita el historial y solo la aplica get_alerts.
+    """
+    horas = compute_worked_hours([entry])
+    minutos = horas["minutos_trabajados"].fillna(0).iloc[0]
+    riesgo = riesgo or {}
+    return _alert_for_record(
+        entry, minutos,
+        carga=riesgo.get("carga_estres", 0),
+        racha_desc=riesgo.get("racha_descanso_corto", 0),
+        racha_est=riesgo.get("racha_estado", 0),
+    )
+
+# -----------------------------
+# Búsqueda en comentarios (índice invertido)
+# -----------------------------
+STOPWORDS = {
+    "a", "al", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los",
+    "me", "mi", "muy", "para", "pero", "por", "que", "se", "su", "un", "una", "y"
+}
+
+def tokenize(text):
+    """Minúsculas, sin tildes, sin stopwords y sin la 's' final de los plurales"""
+    text = unicodedata.normalize("NFKD", str(text or "").lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    tokens = []
+    for tok in re.findall(r"[a-z0-9]+", text):
+        if tok in STOPWORDS:
+            continue
+        if len(tok) > 3 and tok.endswith("s"):
+            tok = tok[:-1]
+        tokens.append(tok)
+    return tokens
+
+SEARCH_JOURNAL_MAX = 500   # altas en el diario antes de reescribir el índice completo
+
+def _entry_hash(entry):
+    """Huella de un registro, para comprobar que el índice corresponde a `data`"""
+    raw = json.dumps(entry, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+def _add_postings(index, doc_id, tokens):
+    for tok in tokens:
+        index["postings"].setdefault(tok, []).append(doc_id)
+    index["n_docs"] = max(index["n_docs"], doc_id + 1)
+
+def index_entry(index, doc_id, entry):
+    """Agrega un registro (su posición en data) al índice; devuelve sus tokens"""
+    tokens = sorted(set(tokenize(entry.get("comentario", ""))))
+    _add_postings(index, doc_id, tokens)
+    index["ultimo"] = _entry_hash(entry)
+    return tokens
+
+def build_search_index(data, index=None):
+    """
+    Construye el índice {"n_docs", "ultimo", "postings": {token: [posiciones]}}, donde
+    "ultimo" es la huella del último registro indexado. Si se pasa un índice existente
+    solo indexa los registros nuevos (data solo crece por el final).
+    """
+    if index is None:
+        index = {"n_docs": 0, "ultimo": None, "postings": {}}
+    for doc_id in range(index["n_docs"], len(data)):
+        index_entry(index, doc_id, data[doc_id])
+    return index
+
+def search_index_path(path):
+    """Archivo del índice asociado a un archivo de datos (data.json -> data.busqueda.json)"""
+    return os.path.splitext(path)[0] + ".busqueda.json"
+
+def _search_journal_path(path):
+    """Diario de altas del índice (data.busqueda.json -> data.busqueda.log)"""
+    return os.path.splitext(path)[0] + ".log"
+
+def save_search_index(path, index):
+    """Escribe el índice completo y vacía su diario de altas"""
+    index["pendientes"] = 0
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    open(_search_journal_path(path), "w").close()
+
+def append_search_index(path, index, doc_id, entry):
+    """
+    Indexa un registro nuevo y lo anota en el diario (una línea) en lugar de reescribir
+    el índice; cada SEARCH_JOURNAL_MAX altas el diario se compacta en el índice.
+    """
+    tokens = index_entry(index, doc_id, entry)
+    index["pendientes"] = index.get("pendientes", 0) + 1
+    if index["pendientes"] >= SEARCH_JOURNAL_MAX:
+        save_search_index(path, index)
+        return
+    line = json.dumps({"doc": doc_id, "ultimo": index["ultimo"], "tokens": tokens}, ensure_ascii=False)
+    with open(_search_journal_path(path), "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+def _replay_search_journal(path, index):
+    """Aplica al índice las altas del diario que sigan a index["n_docs"]"""
+    index["pendientes"] = 0
+    try:
+        with open(_search_journal_path(path), "r", encoding="utf-8") as f:
+            for line in f:
+                rec = json.loads(line)
+                if rec["doc"] < index["n_docs"]:
+                    continue      # ya incluida en el índice compactado
+                if rec["doc"] > index["n_docs"]:
+                    break         # hueco: el resto se indexa desde data
+                _add_postings(index, rec["doc"], rec["tokens"])
+                index["ultimo"] = rec["ultimo"]
+                index["pendientes"] += 1
+    except (OSError, ValueError, KeyError):
+        pass                      # sin diario, o última línea cortada por una caída
+
+def _search_index_matches(index, data):
+    n = index.get("n_docs", 0)
+    if n > len(data):
+        return False
+    return n == 0 or index.get("ultimo") == _entry_hash(data[n - 1])
+
+def load_search_index(path, data=None):
+    """
+    Carga el índice (archivo + diario) y lo pone al día con `data`. Si no existe o su
+    huella no coincide con `data` (registros editados o borrados), lo reconstruye.
+    Si tuvo que reconstruir o indexar registros que faltaban, lo guarda.
+    """
+    data = data or []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        _replay_search_journal(path, index)
+    except Exception:
+        index = None
+    if index is None or not _search_index_matches(index, data):
+        index = build_search_index(data)
+        save_search_index(path, index)
+    elif index["n_docs"] < len(data):
+        build_search_index(data, index)
+        save_search_index(path, index)
+    return index
+
+def search_comments(data, query, index=None, fecha=None, sede=None):
+    """
+    Registros cuyo comentario contiene todas las palabras de `query` (sin importar
+    tildes ni mayúsculas), combinable con los mismos filtros que filter_data.
+    """
+    tokens = set(tokenize(query))
+    if not tokens:
+        return []
+    if index is None:
+        index = build_search_index(data)
+    postings = sorted((index["postings"].get(tok, []) for tok in tokens), key=len)
+    if not postings[0]:
+        return []
+    docs = set(postings[0])
+    for p in postings[1:]:
+        docs.intersection_update(p)
+        if not docs:
+            return []
+    results = [data[i] for i in sorted(docs) if i < len(data)]
+    return filter_data(results, fecha=fecha, sede=sede)
+
 # -----------------------------
 # KPIs & Charts
 # -----------------------------
-def compute_kpis(data):
+def kpi_partials(data, alerts=None, horas=None):
     """
-    Devuelve: estres_promedio, pct_descanso, alertas_count, fig_week (matplotlib.Figure or None),
-    pie_estado (Figure or None)
+    Agregados parciales (sumas y conteos) de un conjunto de registros. Se pueden
+    combinar con merge_kpi_partials (p. ej. entre shards) sin volver a leer los datos.
+    alerts / horas: resultados ya calculados de get_alerts / compute_worked_hours(data).
     """
+    parts = {
+        "n": 0, "estres_sum": 0.0, "descanso_ok": 0, "alertas": 0,
+        "minutos_sum": 0.0, "extra_diaria": 0, "emp_extra": [],
+        "estres_fecha": {}, "estado_counts": {}
+    }
     if not data:
-        return {
-            "estres_promedio": 0.0,
-            "pct_descanso": 0.0,
-            "alertas_count": 0,
-            "fig_week": None,
-            "pie_estado": None
-        }
+        return parts
 
     df = pd.DataFrame(data)
 
@@ -124,54 +678,155 @@ def compute_kpis(data):
     else:
         df["descanso"] = 0
 
-    estres_prom = df["estres"].mean() if not df.empty else 0.0
-    pct_desc = (df["descanso"] >= 45).mean() * 100 if not df.empty else 0.0
-    alerts = get_alerts(data)
-
-    # FIG: weekly bar (last 7 days)
-    fig_week = None
+    parts["n"] = len(df)
+    parts["estres_sum"] = float(df["estres"].sum())
+    parts["descanso_ok"] = int((df["descanso"] >= 45).sum())
+    parts["alertas"] = len(get_alerts(data) if alerts is None else alerts)
+
+    # horas trabajadas / horas extra
+    if horas is None:
+        horas = compute_worked_hours(data)
+    parts["minutos_sum"] = float(horas["minutos_trabajados"].fillna(0).sum())
+    parts["extra_diaria"] = int(horas["extra_diaria"].sum())
+    parts["emp_extra"] = horas.loc[horas["extra_semanal"], ["sede", "nombre"]].drop_duplicates().values.tolist()
+
+    if "fecha" in df.columns:
+        fechas = pd.to_datetime(df["fecha"], errors="coerce")
+        por_fecha = df["estres"].groupby(fechas.dt.date).agg(["sum", "count"])
+        parts["estres_fecha"] = {str(k): [float(v["sum"]), int(v["count"])] for k, v in por_fecha.iterrows()}
+    if "estado" in df.columns:
+        parts["estado_counts"] = {str(k): int(v) for k, v in df["estado"].value_counts().items()}
+    return parts
+
+def merge_kpi_partials(parts_list):
+    merged = kpi_partials([])
+    emp_extra = set()
+    for p in parts_list:
+        for key in ["n", "estres_sum", "descanso_ok", "alertas", "minutos_sum", "extra_diaria"]:
+            merged[key] += p[key]
+        emp_extra.update(tuple(e) for e in p["emp_extra"])
+        for fecha, (suma, count) in p["estres_fecha"].items():
+            acc = merged["estres_fecha"].setdefault(fecha, [0.0, 0])
+            acc[0] += suma
+            acc[1] += count
+        for estado, count in p["estado_counts"].items():
+            merged["estado_counts"][estado] = merged["estado_counts"].get(estado, 0) + count
+    merged["emp_extra"] = sorted(list(e) for e in emp_extra)
+    return merged
+
+def _fig_week_from_partials(parts, title="Estrés promedio (últimos 7 días)"):
+    """FIG: weekly bar (last 7 days)"""
     try:
-        if "fecha" in df.columns:
-            df_dates = df.copy()
-            df_dates["fecha"] = pd.to_datetime(df_dates["fecha"], errors="coerce")
-            df_dates = df_dates.dropna(subset=["fecha"])
-            if not df_dates.empty:
-                maxd = df_dates["fecha"].max()
-                start = maxd - pd.Timedelta(days=6)
-                df_week = df_dates[df_dates["fecha"] >= start]
-                if not df_week.empty:
-                    agg = df_week.groupby(df_week["fecha"].dt.date)["estres"].mean().sort_index()
-                    fig_week, ax = plt.subplots()
-                    ax.bar(agg.index.astype(str), agg.values)
-                    ax.set_title("Estrés promedio (últimos 7 días)")
-                    ax.set_xlabel("Fecha")
-                    ax.set_ylabel("Promedio estrés")
-                    plt.xticks(rotation=45)
-                    plt.tight_layout()
+        if not parts["estres_fecha"]:
+            return None
+        maxd = max(date.fromisoformat(f) for f in parts["estres_fecha"])
+        start = maxd - timedelta(days=6)
+        agg = sorted(
+            (f, suma / count) for f, (suma, count) in parts["estres_fecha"].items()
+            if date.fromisoformat(f) >= start
+        )
+        if not agg:
+            return None
+        fig_week, ax = plt.subplots()
+        ax.bar([f for f, _ in agg], [v for _, v in agg])
+        ax.set_title(title)
+        ax.set_xlabel("Fecha")
+        ax.set_ylabel("Promedio estrés")
+        plt.xticks(rotation=45)
+        plt.tight_layout()
+        return fig_week
     except Exception:
-        fig_week = None
+        return None
 
-    # PIE: estado
-    pie_estado = None
+def _pie_estado_from_partials(parts):
+    """PIE: estado"""
     try:
-        if "estado" in df.columns:
-            counts = df["estado"].value_counts()
-            if not counts.empty:
-                pie_estado, ax2 = plt.subplots()
-                ax2.pie(counts.values, labels=counts.index, autopct="%1.1f%%")
-                ax2.set_title("Estado emocional")
-                plt.tight_layout()
+        counts = sorted(parts["estado_counts"].items(), key=lambda kv: kv[1], reverse=True)
+        if not counts:
+            return None
+        pie_estado, ax2 = plt.subplots()
+        ax2.pie([v for _, v in counts], labels=[k for k, _ in counts], autopct="%1.1f%%")
+        ax2.set_title("Estado emocional")
+        plt.tight_layout()
+        return pie_estado
     except Exception:
-        pie_estado = None
+        return None
+
+def kpis_from_partials(parts, charts=True):
+    """Convierte agregados parciales en el dict de KPIs de compute_kpis (figuras solo si charts)"""
+    n = parts["n"]
+    if not n:
+        return {
+            "estres_promedio": 0.0,
+            "pct_descanso": 0.0,
+            "alertas_count": 0,
+            "horas_promedio": 0.0,
+            "pct_horas_extra": 0.0,
+            "empleados_extra_semanal": 0,
+            "fig_week": None,
+            "pie_estado": None
+        }
+
+    fig_week = _fig_week_from_partials(parts) if charts else None
+    pie_estado = _pie_estado_from_partials(parts) if charts else None
 
     return {
-        "estres_promedio": float(estres_prom),
-        "pct_descanso": float(pct_desc),
-        "alertas_count": len(alerts),
+        "estres_promedio": parts["estres_sum"] / n,
+        "pct_descanso": parts["descanso_ok"] / n * 100,
+        "alertas_count": parts["alertas"],
+        "horas_promedio": parts["minutos_sum"] / n / 60,
+        "pct_horas_extra": parts["extra_diaria"] / n * 100,
+        "empleados_extra_semanal": len(parts["emp_extra"]),
         "fig_week": fig_week,
         "pie_estado": pie_estado
     }
 
+def filtered_kpi_partials(data, fecha=None, sede=None, horas=None, alerts=None):
+    """
+    kpi_partials de los registros que cumplen los filtros, con las alertas y las horas
+    semanales calculadas sobre todo el historial de `data`.
+    horas / alerts: compute_worked_hours(data) / get_alerts(data, fecha, sede) ya calculados.
+    """
+    if horas is None:
+        horas = compute_worked_hours(data)
+    if alerts is None:
+        alerts = get_alerts(data, fecha=fecha, sede=sede, horas=horas)
+    mask = _filter_mask(data, fecha, sede)
+    filtered = [d for d, ok in zip(data, mask) if ok]
+    horas_f = horas[mask].reset_index(drop=True) if not horas.empty else horas
+    return kpi_partials(filtered, alerts=alerts, horas=horas_f)
+
+def compute_kpis(data, fecha=None, sede=None):
+    """
+    Devuelve: estres_promedio, pct_descanso, alertas_count, horas_promedio, pct_horas_extra,
+    empleados_extra_semanal, fig_week (matplotlib.Figure or None), pie_estado (Figure or None)
+    fecha/sede: filtros (como filter_data) aplicados después de las reglas de historial.
+    """
+    return kpis_from_partials(filtered_kpi_partials(data, fecha=fecha, sede=sede))
+
+def admin_partials(data, fecha=None, sede=None):
+    """
+    Lo que muestra el panel admin, calculando horas y puntajes de riesgo una sola vez:
+    registros filtrados, alertas, agregados de KPIs (kpi_partials), ranking y horas
+    semanales. Las reglas de historial usan todo `data` antes de filtrar.
+    """
+    horas = compute_worked_hours(data)
+    scores = compute_burnout_scores(data)
+    alerts = get_alerts(data, fecha=fecha, sede=sede, horas=horas, scores=scores)
+    return {
+        "registros": filter_data(data, fecha=fecha, sede=sede),
+        "alertas": alerts,
+        "parts": filtered_kpi_partials(data, fecha=fecha, sede=sede, horas=horas, alerts=alerts),
+        "ranking": burnout_ranking(data, fecha=fecha, sede=sede, scores=scores),
+        "semanas": weekly_hours(data, fecha=fecha, sede=sede, horas=horas),
+    }
+
+def admin_query(data, fecha=None, sede=None):
+    """admin_partials con los KPIs ya calculados (clave "kpis" en lugar de "parts")"""
+    res = admin_partials(data, fecha=fecha, sede=sede)
+    res["kpis"] = kpis_from_partials(res.pop("parts"))
+    return res
+
 # -----------------------------
 # PDF helpers
 # -----------------------------
@@ -508,3 +1163,190 @@ def generate_pdf_personal(data):
     c.showPage()
     c.save()
     return tmp.name
+
+# -----------------------------
+# PDF: reporte consolidado (datos, KPIs, alertas y gráficas en una sola pasada)
+# -----------------------------
+def _fig_to_png(fig):
+    """Guarda la figura en un PNG temporal y la cierra; devuelve la ruta o None"""
+    if fig is None:
+        return None
+    tmp_img = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
+    tmp_img.close()
+    try:
+        fig.savefig(tmp_img.name, bbox_inches="tight")
+    except Exception:
+        os.unlink(tmp_img.name)
+        return None
+    finally:
+        plt.close(fig)
+    return tmp_img.name
+
+def _paginate(rows, y_first, y_rest, line_height=12, bottom=60):
+    """Parte las filas en páginas: la primera empieza en y_first, las siguientes en y_rest"""
+    first = (y_first - bottom) // line_height + 1
+    rest = (y_rest - bottom) // line_height + 1
+    pages = [rows[:first]]
+    rows = rows[first:]
+    while rows:
+        pages.append(rows[:rest])
+        rows = rows[rest:]
+    return pages
+
+def _draw_rows(c, rows, headers, x_positions, y):
+    """Encabezado + filas ya recortadas a una página (ver _paginate)"""
+    c.setFont("Helvetica-Bold", 11)
+    for h, x in zip(headers, x_positions):
+        c.drawString(x, y + 15, h.capitalize())
+    c.setFont("Helvetica", 9)
+    for row in rows:
+        for value, x in zip(row, x_positions):
+            c.drawString(x, y, value)
+        y -= 12
+
+def _section_title(c, title, key):
+    c.bookmarkPage(key)
+    c.addOutlineEntry(title, key, level=0)
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(40, 770, title)
+    c.line(40, 765, 560, 765)
+
+def _draw_kpi_lines(c, kpis, n_alertas, y=740):
+    c.setFont("Helvetica", 12)
+    for line in [
+        f"Estrés promedio: {kpis['estres_promedio']:.2f}",
+        f"% descansos ≥ 45 min: {kpis['pct_descanso']:.1f}%",
+        f"Alertas: {n_alertas}",
+        f"Horas trabajadas promedio: {kpis['horas_promedio']:.1f} h",
+        f"% jornadas con horas extra: {kpis['pct_horas_extra']:.1f}%",
+    ]:
+        c.drawString(40, y, line)
+        y -= 15
+
+def generate_pdf_report(data):
+    """
+    Reporte completo en un solo PDF: índice, resumen general con gráficas, alertas y
+    una sección por sede. Los KPIs, alertas y horas se calculan una vez por sede y el
+    resumen general se obtiene combinando esos agregados; cada gráfica se renderiza
+    a PNG una sola vez.
+    """
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+    c = canvas.Canvas(tmp.name, pagesize=letter)
+
+    if not data:
+        c.setFont("Helvetica-Bold", 16)
+        c.drawString(40, 770, "Reporte completo — Bienestar Starbucks")
+        c.line(40, 765, 560, 765)
+        c.setFont("Helvetica", 12)
+        c.drawString(40, 740, "No hay datos.")
+        c.showPage()
+        c.save()
+        return tmp.name
+
+    # --- cálculo (una sola vez) ---
+    por_sede = {}
+    for d in data:
+        por_sede.setdefault(d.get("sede") or "", []).append(d)
+
+    sedes = []
+    all_alerts = []
+    all_parts = []
+    for sede in sorted(por_sede):
+        registros = por_sede[sede]
+        horas = compute_worked_hours(registros)
+        alerts = get_alerts(registros, horas=horas)
+        parts = kpi_partials(registros, alerts=alerts, horas=horas)
+        rows = [
+            [str(r.get("fecha", "")), str(r.get("nombre", ""))[:30],
+             "" if pd.isna(m) else f"{m / 60:.1f}", str(r.get("estres", "")), str(r.get("estado", ""))[:15]]
+            for r, m in zip(registros, horas["minutos_trabajados"])
+        ]
+        rows.sort(key=lambda row: (row[0], row[1]))
+        sedes.append({
+            "sede": sede,
+            "kpis": kpis_from_partials(parts, charts=False),
+            "alertas": len(alerts),
+            "pages": _paginate(rows, 645, 705),
+        })
+        all_alerts.extend(alerts)
+        all_parts.append(parts)
+
+    total = merge_kpi_partials(all_parts)
+    kpis = kpis_from_partials(total, charts=False)
+    charts = [p for p in (_fig_to_png(_fig_week_from_partials(total)), _fig_to_png(_pie_estado_from_partials(total))) if p]
+
+    alert_rows = [
+        [str(a["fecha"]), str(a["sede"] or "")[:15], str(a["nombre"] or "")[:15], a["motivo"][:55], str(a["estres"])]
+        for a in sorted(all_alerts, key=lambda a: (str(a["fecha"] or ""), a["sede"] or "", a["nombre"] or ""))
+    ]
+    alert_pages = _paginate(alert_rows, 705, 705)
+
+    # --- índice: el número de páginas de cada sección ya se conoce ---
+    toc = [("Resumen general", "resumen", 1), ("Alertas", "alertas", len(alert_pages))]
+    toc += [(f"Sede {s['sede']}", f"sede_{i}", len(s["pages"])) for i, s in enumerate(sedes)]
+
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(40, 770, "Reporte completo — Bienestar Starbucks")
+    c.line(40, 765, 560, 765)
+    c.setFont("Helvetica", 10)
+    c.drawString(40, 748, f"Generado: {datetime.now().strftime('%Y-%m-%d %H:%M')} — {len(data)} registros")
+    c.setFont("Helvetica-Bold", 13)
+    c.drawString(40, 715, "Índice")
+    toc_pages = _paginate(toc, 695, 740, line_height=18)
+    page = len(toc_pages) + 1
+    for j, entries in enumerate(toc_pages):
+        y = 695 if j == 0 else 740
+        c.setFont("Helvetica", 11)
+        for title, key, n_pages in entries:
+            c.drawString(60, y, title)
+            c.drawRightString(560, y, str(page))
+            c.linkRect("", key, (55, y - 3, 565, y + 11), relative=1, Border="[0 0 0]")
+            page += n_pages
+            y -= 18
+        c.showPage()
+
+    # --- resumen general ---
+    _section_title(c, "Resumen general", "resumen")
+    _draw_kpi_lines(c, kpis, len(all_alerts))
+    c.drawString(40, 665, f"Empleados > 48 h semanales: {kpis['empleados_extra_semanal']}")
+    y_pos = 640
+    for png in charts:
+        c.drawImage(png, 40, y_pos - 270, width=400, height=260, preserveAspectRatio=True)
+        y_pos -= 285
+    c.showPage()
+
+    # --- alertas ---
+    for i, rows in enumerate(alert_pages):
+        if i == 0:
+            _section_title(c, "Alertas", "alertas")
+            c.setFont("Helvetica", 12)
+            c.drawString(40, 740, f"Alertas encontradas: {len(all_alerts)}")
+        if rows:
+            _draw_rows(c, rows, ["fecha", "sede", "nombre", "motivo", "estres"], [40, 110, 200, 290, 545], 705)
+        else:
+            c.setFont("Helvetica", 12)
+            c.drawString(40, 720, "No se detectaron alertas.")
+        c.showPage()
+
+    # --- secciones por sede ---
+    headers = ["fecha", "nombre", "horas", "estres", "estado"]
+    x_positions = [40, 140, 320, 400, 460]
+    for i, s in enumerate(sedes):
+        for j, rows in enumerate(s["pages"]):
+            y = 705
+            if j == 0:
+                _section_title(c, f"Sede {s['sede']}", f"sede_{i}")
+                _draw_kpi_lines(c, s["kpis"], s["alertas"])
+                y = 645
+            _draw_rows(c, rows, headers, x_positions, y)
+            c.showPage()
+
+    c.save()
+
+    for p in charts:
+        try:
+            os.unlink(p)
+        except Exception:
+            pass
+
+    return tmp.name